@@ -4,232 +4,431 @@ Automated HAP Pairing Test Script
 This script tests if a HAP server is properly accessible for pairing.
 Exit code 0 = success (HAP server is working)
 Exit code 1 = failure (HAP server is broken)
+
+mDNS is checked in-process when the optional zeroconf package is installed
+(pip install zeroconf), otherwise via the dns-sd command line tool.
+Set LOG_LEVEL (e.g. INFO) to hide the DEBUG output.
+
+A long-running harness can load this file and await run() repeatedly; it
+returns the exit code instead of exiting.
 """
 
+import os
+import re
 import sys
 import time
+import asyncio
 import socket
 import json
+import logging
+import threading
 import subprocess
-import urllib.request
-import urllib.error
-from typing import Optional, Dict, Any
+import http.client
+from typing import Optional, Dict, Any, Tuple
+
+try:
+    from zeroconf import ServiceBrowser, Zeroconf
+except ImportError:  # optional, fall back to dns-sd
+    Zeroconf = None
 
 # Configuration
+# Literal loopback address so probes skip a getaddrinfo("localhost") per connection
+_HOST = "127.0.0.1"
 HAP_PORT = 51826
 WEB_PORT = 3000
 TIMEOUT = 10
 MAX_RETRIES = 3
-
-def log(message: str, level: str = "INFO"):
-    """Log messages with timestamp"""
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] [{level}] {message}", file=sys.stderr)
+STARTUP_WAIT = 2.0
+HAP_SERVICE = "_hap._tcp.local."
+
+# HAP-NodeJS adds a suffix to the bridge name (last 4 chars of MAC)
+_BRIDGE_RE = re.compile(r'SmartThings Bridge \w+')
+_STATUS_RE = re.compile(rb'HTTP/1\.\d (\d+)')
+
+# Between INFO and WARNING, for checks that passed
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+# Keep the report's existing [WARN] label
+logging.addLevelName(logging.WARNING, "WARN")
+
+logger = logging.getLogger(__name__)
+
+# pino level names (the bridge's LOG_LEVEL) that logging doesn't know about
+_PINO_LEVELS = {
+    "TRACE": logging.DEBUG,
+    "FATAL": logging.CRITICAL,
+    "SILENT": logging.CRITICAL + 1,
+}
+
+def _log_level(name: str) -> Optional[int]:
+    """Map a LOG_LEVEL value to a logging level, or None if it is unknown"""
+    name = name.upper()
+    if name in _PINO_LEVELS:
+        return _PINO_LEVELS[name]
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else None
+
+def _open(host: str, port: int, timeout: float = TIMEOUT) -> socket.socket:
+    """Open a blocking connection to host:port with TCP_NODELAY set"""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    if hasattr(socket, "TCP_NODELAY"):
+        # Disable Nagle so small probe requests are flushed immediately
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
 
 def test_port_open(host: str, port: int, timeout: int = 5) -> bool:
     """Test if a port is open and accepting connections"""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = sock.connect_ex((host, port))
-        sock.close()
-        return result == 0
+        with _open(host, port, timeout):
+            return True
+    except OSError:
+        # Refused or timed out - nothing is accepting connections yet
+        return False
     except Exception as e:
-        log(f"Port test failed for {host}:{port} - {e}", "ERROR")
+        logger.error("Port test failed for %s:%s - %s", host, port, e)
         return False
 
-def test_mdns_advertisement() -> bool:
-    """Test if the HAP service is advertised via mDNS"""
+async def _capture(cmd: list, seconds: float) -> str:
+    """Run a long-lived dns-sd command for a fixed time and return its output"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    chunks = []
+
+    async def drain():
+        async for line in proc.stdout:
+            chunks.append(line)
+
+    # Keep the pipe drained while waiting so the child can never block on a
+    # full buffer, and keep whatever it printed once time runs out
+    try:
+        await asyncio.wait_for(drain(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+    if proc.returncode is None:
+        proc.terminate()
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=1)
+    except asyncio.TimeoutError:
+        # dns-sd ignored terminate(); kill it and keep what it printed
+        proc.kill()
+        await proc.wait()
+    return b"".join(chunks).decode(errors="replace")
+
+async def _browse(cmd: list, marker: str, seconds: float) -> str:
+    """Read dns-sd output as it arrives, stopping early once marker shows up"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    output = ""
+    try:
+        while marker not in output:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            line = await asyncio.wait_for(proc.stdout.readline(), timeout=remaining)
+            if not line:
+                break
+            output += line.decode(errors="replace")
+    except asyncio.TimeoutError:
+        pass
+    if proc.returncode is None:
+        proc.terminate()
+    # Only stdout is piped, so read what is left directly instead of communicate()
+    try:
+        rest = await asyncio.wait_for(proc.stdout.read(), timeout=1)
+        output += rest.decode(errors="replace")
+    except asyncio.TimeoutError:
+        # dns-sd ignored terminate(); kill it and keep what was already read
+        proc.kill()
+    await proc.wait()
+    return output
+
+class _BridgeListener:
+    """Collects SmartThings Bridge instances seen by a zeroconf browser"""
+
+    def __init__(self):
+        self.names = []
+        self.found = threading.Event()
+
+    def add_service(self, zc, type_: str, name: str):
+        if "SmartThings Bridge" in name:
+            self.names.append(name)
+            self.found.set()
+
+    def update_service(self, zc, type_: str, name: str):
+        pass
+
+    def remove_service(self, zc, type_: str, name: str):
+        pass
+
+def _mdns_via_zeroconf() -> bool:
+    """Browse for and resolve the bridge in-process using zeroconf"""
+    try:
+        zc = Zeroconf()
+    except Exception as e:
+        logger.error("mDNS test failed: %s", e)
+        return False
+
+    try:
+        listener = _BridgeListener()
+        ServiceBrowser(zc, HAP_SERVICE, listener)
+
+        # Returns as soon as the first bridge instance is announced
+        if not listener.found.wait(timeout=2.0):
+            logger.error("No SmartThings Bridge found via mDNS")
+            return False
+
+        logger.log(SUCCESS, "mDNS advertisement found!")
+        for name in list(listener.names):
+            logger.info("Found bridge instance: %s", name)
+            info = zc.get_service_info(HAP_SERVICE, name, timeout=2000)
+            if info and info.port == HAP_PORT:
+                logger.log(SUCCESS, "Bridge '%s' properly advertised on port %s", name, HAP_PORT)
+                return True
+
+        logger.warning("No SmartThings Bridge properly advertised")
+        return False
+    except Exception as e:
+        logger.error("mDNS test failed: %s", e)
+        return False
+    finally:
+        zc.close()
+
+async def _mdns_via_dns_sd() -> bool:
+    """Browse for and resolve the bridge using the dns-sd tool"""
     try:
         # Using dns-sd on macOS to discover HAP services
         cmd = ["dns-sd", "-B", "_hap._tcp", "local."]
-        log("Testing mDNS advertisement...", "INFO")
-
-        # Run dns-sd with a timeout
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        time.sleep(3)  # Give it time to discover
-        proc.terminate()
 
-        output, error = proc.communicate(timeout=1)
+        # Give dns-sd up to 3s to discover, but stop as soon as the bridge shows up
+        output = await _browse(cmd, "SmartThings Bridge", 3)
 
         # Check if we found any HAP services
         if "_hap._tcp" in output:
-            log("mDNS advertisement found!", "SUCCESS")
+            logger.log(SUCCESS, "mDNS advertisement found!")
 
             # HAP-NodeJS adds a suffix to the bridge name (last 4 chars of MAC)
             # Try browsing for any SmartThings Bridge instance
+            # Scan the whole buffer once rather than splitting it into lines
             found_bridge = False
-            for line in output.split('\n'):
-                if 'SmartThings Bridge' in line:
-                    # Extract the full instance name
-                    import re
-                    match = re.search(r'SmartThings Bridge \w+', line)
-                    if match:
-                        bridge_name = match.group(0)
-                        log(f"Found bridge instance: {bridge_name}", "INFO")
-
-                        # Try to resolve this specific instance
-                        cmd = ["dns-sd", "-L", bridge_name, "_hap._tcp", "local."]
-                        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                        time.sleep(2)
-                        proc.terminate()
-                        resolve_output, _ = proc.communicate(timeout=1)
-
-                        if "can be reached at" in resolve_output and "51826" in resolve_output:
-                            log(f"Bridge '{bridge_name}' properly advertised on port 51826", "SUCCESS")
-                            found_bridge = True
-                            break
+            for match in _BRIDGE_RE.finditer(output):
+                # Extract the full instance name
+                bridge_name = match.group(0)
+                logger.info("Found bridge instance: %s", bridge_name)
+
+                # Try to resolve this specific instance
+                cmd = ["dns-sd", "-L", bridge_name, "_hap._tcp", "local."]
+                resolve_output = await _capture(cmd, 2)
+
+                if "can be reached at" in resolve_output and "51826" in resolve_output:
+                    logger.log(SUCCESS, "Bridge '%s' properly advertised on port 51826", bridge_name)
+                    found_bridge = True
+                    break
 
             if found_bridge:
                 return True
             else:
-                log("No SmartThings Bridge properly advertised", "WARN")
+                logger.warning("No SmartThings Bridge properly advertised")
                 return False
         else:
-            log("No HAP services found via mDNS", "ERROR")
+            logger.error("No HAP services found via mDNS")
             return False
 
-    except subprocess.TimeoutExpired:
-        # This is actually expected - dns-sd runs continuously
-        return True if "_hap._tcp" in output else False
     except Exception as e:
-        log(f"mDNS test failed: {e}", "ERROR")
+        logger.error("mDNS test failed: %s", e)
         return False
 
-def test_hap_discovery_endpoint() -> bool:
+async def test_mdns_advertisement() -> bool:
+    """Test if the HAP service is advertised via mDNS"""
+    logger.info("Testing mDNS advertisement...")
+    if Zeroconf is not None:
+        return await asyncio.to_thread(_mdns_via_zeroconf)
+    return await _mdns_via_dns_sd()
+
+def _check_accessories_status(status: int) -> bool:
+    """Check the /accessories status code of an unpaired HAP server"""
+    # This should fail with 401 or similar if HAP is working
+    # (requires pairing)
+    if status in [401, 470]:  # 470 is HAP "Connection Authorization Required"
+        logger.log(SUCCESS, "HAP server properly requires pairing (code %s)", status)
+        return True
+    elif status < 400:
+        logger.warning("Unexpected success on /accessories: %s", status)
+        return False
+    else:
+        logger.error("Unexpected HTTP error: %s", status)
+        return False
+
+def _hap_discovery_request(conn: http.client.HTTPConnection) -> bool:
     """Test the HAP discovery endpoint (HTTP GET /accessories)"""
     try:
         # HAP accessories endpoint should respond even without pairing
-        url = f"http://localhost:{HAP_PORT}/accessories"
-
-        req = urllib.request.Request(url)
-
         try:
-            with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
-                # This should fail with 401 or similar if HAP is working
-                # (requires pairing)
-                status = response.getcode()
-                log(f"Unexpected success on /accessories: {status}", "WARN")
-                return False
-        except urllib.error.HTTPError as e:
-            # Expected behavior - should require pairing
-            if e.code in [401, 470]:  # 470 is HAP "Connection Authorization Required"
-                log(f"HAP server properly requires pairing (code {e.code})", "SUCCESS")
-                return True
-            else:
-                log(f"Unexpected HTTP error: {e.code}", "ERROR")
-                return False
-        except urllib.error.URLError as e:
+            conn.request("GET", "/accessories")
+            response = conn.getresponse()
+            response.read()
+        except OSError as e:
             # Connection refused or timeout
-            log(f"Cannot connect to HAP server: {e}", "ERROR")
+            logger.error("Cannot connect to HAP server: %s", e)
             return False
 
+        return _check_accessories_status(response.status)
+
     except Exception as e:
-        log(f"HAP discovery test failed: {e}", "ERROR")
+        logger.error("HAP discovery test failed: %s", e)
         return False
 
-def test_web_api() -> bool:
+async def test_hap_discovery_endpoint(conn: http.client.HTTPConnection) -> bool:
+    """Test the HAP discovery endpoint without blocking the event loop"""
+    return await asyncio.to_thread(_hap_discovery_request, conn)
+
+def _web_api_request(conn: http.client.HTTPConnection) -> bool:
     """Test if the web API is responsive"""
     try:
-        url = f"http://localhost:{WEB_PORT}/api/homekit/pairing"
-
-        req = urllib.request.Request(url)
+        conn.request("GET", "/api/homekit/pairing")
+        response = conn.getresponse()
 
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
-            data = json.loads(response.read().decode())
-
-            # Check for expected fields (API changed to use "pairingCode")
-            if "qrCode" in data and ("pairingCode" in data or "setupCode" in data or "pinCode" in data):
-                log("Web API pairing endpoint working", "SUCCESS")
-                log(f"Pairing info: {json.dumps(data, indent=2)}", "DEBUG")
-                return True
-            else:
-                log(f"Web API returned unexpected data: {data}", "ERROR")
-                return False
+        if response.status != 200:
+            response.read()
+            logger.error("Web API test failed: HTTP %s", response.status)
+            return False
 
-    except Exception as e:
-        log(f"Web API test failed: {e}", "ERROR")
-        return False
+        data = json.load(response)
 
-def test_hap_tcp_connection() -> bool:
-    """Test if we can establish a TCP connection to the HAP port"""
-    try:
-        log(f"Testing TCP connection to HAP port {HAP_PORT}...", "INFO")
-
-        # Test raw TCP connection
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(TIMEOUT)
-
-        result = sock.connect_ex(("localhost", HAP_PORT))
-
-        if result == 0:
-            log("TCP connection to HAP port successful", "SUCCESS")
-
-            # Try to send a basic HTTP request
-            try:
-                sock.send(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
-                response = sock.recv(1024)
-
-                if response:
-                    log(f"HAP server responded with {len(response)} bytes", "SUCCESS")
-                    # Check if it's an HTTP response
-                    if b"HTTP" in response:
-                        log("HAP server speaks HTTP", "SUCCESS")
-                        return True
-                    else:
-                        log("HAP server response is not HTTP", "ERROR")
-                        return False
-                else:
-                    log("HAP server did not respond", "ERROR")
-                    return False
-            except socket.timeout:
-                log("HAP server connection timed out", "ERROR")
-                return False
-            finally:
-                sock.close()
+        # Check for expected fields (API changed to use "pairingCode")
+        if "qrCode" in data and ("pairingCode" in data or "setupCode" in data or "pinCode" in data):
+            logger.log(SUCCESS, "Web API pairing endpoint working")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Pairing info: %s", json.dumps(data, indent=2))
+            return True
         else:
-            log(f"Cannot connect to HAP port: error code {result}", "ERROR")
+            logger.error("Web API returned unexpected data: %s", data)
             return False
 
     except Exception as e:
-        log(f"TCP connection test failed: {e}", "ERROR")
+        logger.error("Web API test failed: %s", e)
         return False
 
-def run_all_tests() -> bool:
-    """Run all tests and return overall status"""
-    log("=" * 50, "INFO")
-    log("Starting HAP Pairing Tests", "INFO")
-    log("=" * 50, "INFO")
+async def test_web_api(conn: http.client.HTTPConnection) -> bool:
+    """Test the web API without blocking the event loop"""
+    return await asyncio.to_thread(_web_api_request, conn)
 
-    results = {
-        "TCP Connection": False,
-        "HAP Discovery": False,
-        "Web API": False,
-        "mDNS Advertisement": False
-    }
+async def test_hap_tcp_connection() -> Tuple[bool, Optional[bool]]:
+    """Test if we can establish a TCP connection to the HAP port
 
-    # Test 1: TCP Connection
-    log("\nTest 1: TCP Connection to HAP Port", "INFO")
-    results["TCP Connection"] = test_hap_tcp_connection()
+    Returns (tcp_ok, discovery_ok). The probe asks for /accessories, so a
+    parsed status line also answers the discovery check; discovery_ok is
+    None when no status line could be read.
+    """
+    try:
+        logger.info("Testing TCP connection to HAP port %s...", HAP_PORT)
 
-    # Test 2: HAP Discovery Endpoint
-    log("\nTest 2: HAP Discovery Endpoint", "INFO")
-    results["HAP Discovery"] = test_hap_discovery_endpoint()
+        # Test raw TCP connection (asyncio sets TCP_NODELAY on its transports)
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(_HOST, HAP_PORT), timeout=TIMEOUT
+            )
+        except OSError as e:
+            logger.error("Cannot connect to HAP port: %s", e)
+            return False, False
 
-    # Test 3: Web API
-    log("\nTest 3: Web API Pairing Endpoint", "INFO")
-    results["Web API"] = test_web_api()
+        logger.log(SUCCESS, "TCP connection to HAP port successful")
+
+        # Try to send a basic HTTP request
+        try:
+            writer.write(b"GET /accessories HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(1024), timeout=TIMEOUT)
+
+            if response:
+                logger.log(SUCCESS, "HAP server responded with %s bytes", len(response))
+                # Check if it's an HTTP response
+                match = _STATUS_RE.match(response)
+                if match:
+                    logger.log(SUCCESS, "HAP server speaks HTTP")
+                    return True, _check_accessories_status(int(match.group(1)))
+                else:
+                    logger.error("HAP server response is not HTTP")
+                    return False, None
+            else:
+                logger.error("HAP server did not respond")
+                return False, None
+        except asyncio.TimeoutError:
+            logger.error("HAP server connection timed out")
+            return False, None
+        finally:
+            writer.close()
 
-    # Test 4: mDNS Advertisement (most important for HomeKit discovery)
-    log("\nTest 4: mDNS Advertisement", "INFO")
-    results["mDNS Advertisement"] = test_mdns_advertisement()
+    except Exception as e:
+        logger.error("TCP connection test failed: %s", e)
+        return False, None
+
+async def _test_hap_port(conn: http.client.HTTPConnection) -> Tuple[bool, bool]:
+    """Run the raw TCP probe, falling back to the discovery request if needed"""
+    tcp_ok, discovery_ok = await test_hap_tcp_connection()
+    if discovery_ok is None:
+        # No status line to go on, so ask again through http.client
+        discovery_ok = await test_hap_discovery_endpoint(conn)
+    return tcp_ok, discovery_ok
+
+def wait_for_hap_port(timeout: float = STARTUP_WAIT) -> bool:
+    """Poll the HAP port until it accepts connections or timeout expires"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if test_port_open(_HOST, HAP_PORT, timeout=0.1):
+            return True
+        time.sleep(0.02)
+    return False
+
+async def run_all_tests() -> bool:
+    """Run all tests concurrently and return overall status"""
+    logger.info("=" * 50)
+    logger.info("Starting HAP Pairing Tests")
+    logger.info("=" * 50)
+
+    # The probes are independent, so run them side by side: total time is
+    # bounded by the slowest probe (usually the mDNS browse) rather than the sum.
+    # mDNS Advertisement is the most important for HomeKit discovery.
+    names = ["HAP Port", "Web API", "mDNS Advertisement"]
+
+    # One HTTP connection per server, closed once the probes finish
+    hap_conn = http.client.HTTPConnection(_HOST, HAP_PORT, timeout=TIMEOUT)
+    web_conn = http.client.HTTPConnection(_HOST, WEB_PORT, timeout=TIMEOUT)
+    try:
+        outcomes = await asyncio.gather(
+            _test_hap_port(hap_conn),
+            test_web_api(web_conn),
+            test_mdns_advertisement(),
+            return_exceptions=True,
+        )
+    finally:
+        hap_conn.close()
+        web_conn.close()
+
+    for test_name, outcome in zip(names, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("%s test crashed: %s", test_name, outcome)
+    hap, web_ok, mdns_ok = [
+        None if isinstance(outcome, Exception) else outcome for outcome in outcomes
+    ]
+    tcp_ok, discovery_ok = hap or (False, False)
+
+    results = {
+        "TCP Connection": tcp_ok,
+        "HAP Discovery": discovery_ok,
+        "Web API": bool(web_ok),
+        "mDNS Advertisement": bool(mdns_ok),
+    }
 
     # Summary
-    log("\n" + "=" * 50, "INFO")
-    log("Test Results:", "INFO")
+    logger.info("\n" + "=" * 50)
+    logger.info("Test Results:")
     for test_name, passed in results.items():
         status = "✅ PASS" if passed else "❌ FAIL"
-        log(f"  {test_name}: {status}", "INFO" if passed else "ERROR")
+        logger.log(logging.INFO if passed else logging.ERROR, "  %s: %s", test_name, status)
 
     # Overall result - all tests must pass for pairing to work
     all_passed = all(results.values())
@@ -237,36 +436,55 @@ def run_all_tests() -> bool:
     # For git bisect, we need at least TCP and mDNS to work
     critical_passed = results["TCP Connection"] and results["mDNS Advertisement"]
 
-    log("=" * 50, "INFO")
+    logger.info("=" * 50)
     if all_passed:
-        log("✅ All tests passed - HAP server should be pairable", "SUCCESS")
+        logger.log(SUCCESS, "✅ All tests passed - HAP server should be pairable")
         return True
     elif critical_passed:
-        log("⚠️  Critical tests passed but some issues detected", "WARN")
+        logger.warning("⚠️  Critical tests passed but some issues detected")
         return True
     else:
-        log("❌ Critical tests failed - HAP server is NOT pairable", "ERROR")
+        logger.error("❌ Critical tests failed - HAP server is NOT pairable")
         return False
 
-def main():
-    """Main entry point"""
+async def run() -> int:
+    """Wait for the HAP port, run all tests and return the exit code"""
     try:
-        # Wait a bit for the server to fully start
-        log("Waiting for server to stabilize...", "INFO")
-        time.sleep(2)
+        # Give the server a moment to start, but don't wait once it's listening
+        logger.info("Waiting for server to stabilize...")
+        if not await asyncio.to_thread(wait_for_hap_port):
+            logger.warning("HAP port not open after %ss, running tests anyway", STARTUP_WAIT)
 
         # Run tests
-        success = run_all_tests()
+        success = await run_all_tests()
 
-        # Exit with appropriate code for git bisect
-        sys.exit(0 if success else 1)
+        # Exit code for git bisect
+        return 0 if success else 1
 
-    except KeyboardInterrupt:
-        log("\nTests interrupted by user", "WARN")
-        sys.exit(130)
     except Exception as e:
-        log(f"Unexpected error: {e}", "ERROR")
-        sys.exit(1)
+        logger.error("Unexpected error: %s", e)
+        return 1
+
+def main() -> int:
+    """Main entry point"""
+    level_name = os.environ.get("LOG_LEVEL", "DEBUG")
+    level = _log_level(level_name)
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.DEBUG if level is None else level,
+        format="[%(asctime)s] [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    if level is None:
+        logger.warning("Unknown LOG_LEVEL %r, using DEBUG", level_name)
+    # Keep asyncio's own debug chatter (selector choice etc.) out of the report
+    logging.getLogger("asyncio").setLevel(logging.INFO)
+
+    try:
+        return asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.warning("\nTests interrupted by user")
+        return 130
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -4,41 +4,170 @@ Focused mDNS Test for HAP Server
 Tests if the HAP server is properly advertising via mDNS/Bonjour
 Exit 0 = success (discoverable)
 Exit 1 = failure (not discoverable)
+
+Uses the optional zeroconf package (pip install zeroconf) when installed,
+otherwise shells out to avahi-browse or dns-sd.
 """
 
+import os
 import sys
 import time
+import select
+import threading
 import subprocess
 import socket
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from zeroconf import ServiceBrowser, Zeroconf
+except ImportError:  # optional, fall back to avahi-browse/dns-sd
+    Zeroconf = None
+
+HAP_SERVICE = "_hap._tcp.local."
+# Literal loopback address so probes skip a getaddrinfo("localhost") per connection
+_HOST = "127.0.0.1"
+
+# Commands started for the CLI race, so the tool that loses can be killed
+_children = set()
+_children_lock = threading.Lock()
+_stopped = threading.Event()
+
+class _Cancelled(Exception):
+    """The race already has a result, so this tool should stop"""
+
+def _spawn(cmd, **kwargs):
+    """Start cmd and register it so _stop_children() can kill it"""
+    with _children_lock:
+        if _stopped.is_set():
+            raise _Cancelled()
+        proc = subprocess.Popen(cmd, **kwargs)
+        _children.add(proc)
+    return proc
+
+def _release(proc):
+    """Forget a finished command, raising _Cancelled if it was killed"""
+    with _children_lock:
+        _children.discard(proc)
+    if _stopped.is_set():
+        raise _Cancelled()
+
+def _stop_children():
+    """Kill every command still running and refuse to start new ones"""
+    with _children_lock:
+        _stopped.set()
+        for proc in _children:
+            proc.kill()
+
+class _BridgeListener:
+    """Collects SmartThings Bridge instances seen by a zeroconf browser"""
+
+    def __init__(self):
+        self.names = []
+        self.found = threading.Event()
+
+    def add_service(self, zc, type_, name):
+        if "SmartThings Bridge" in name:
+            self.names.append(name)
+            self.found.set()
+
+    def update_service(self, zc, type_, name):
+        pass
+
+    def remove_service(self, zc, type_, name):
+        pass
+
+def test_mdns_with_zeroconf():
+    """Test in-process using the zeroconf package"""
+    zc = None
+    try:
+        zc = Zeroconf()
+        listener = _BridgeListener()
+        ServiceBrowser(zc, HAP_SERVICE, listener)
+
+        # Test 1: Browse for the bridge, returning as soon as one is announced
+        if not listener.found.wait(timeout=2.0):
+            print("[FAIL] No SmartThings Bridge found via mDNS", file=sys.stderr)
+            return False
+
+        print("[INFO] Found HAP services via mDNS", file=sys.stderr)
+
+        # Test 2: Resolve the announced instance and check its port
+        for name in list(listener.names):
+            info = zc.get_service_info(HAP_SERVICE, name, timeout=2000)
+            if info and info.port == 51826:
+                print("[SUCCESS] Bridge service properly advertised on port 51826", file=sys.stderr)
+                return True
+
+        print("[FAIL] No SmartThings Bridge properly advertised on port 51826", file=sys.stderr)
+    except Exception as e:
+        print(f"[ERROR] zeroconf test failed: {e}", file=sys.stderr)
+    finally:
+        if zc is not None:
+            zc.close()
+
+    return False
+
+def _run_for(cmd, timeout):
+    """Run a command for at most timeout seconds and return what it printed"""
+    proc = _spawn(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        output, _ = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # dns-sd never exits on its own; keep whatever it printed in time
+        proc.kill()
+        output, _ = proc.communicate()
+    _release(proc)
+    return output
 
 def test_mdns_with_avahi():
-    """Test using avahi-browse if available (Linux)"""
+    """Test using avahi-browse if available (Linux)
+
+    Returns None when avahi-browse is not installed.
+    """
     try:
-        result = subprocess.run(
-            ["avahi-browse", "-ptr", "_hap._tcp"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if "SmartThings" in result.stdout:
+        if "SmartThings" in _run_for(["avahi-browse", "-ptr", "_hap._tcp"], 5):
             return True
-    except (subprocess.TimeoutExpired, FileNotFoundError):
+    except FileNotFoundError:
+        return None
+    except _Cancelled:
         pass
     return False
 
+def _browse(cmd, marker, timeout=3.0):
+    """Read output from a long-running dns-sd command until marker appears"""
+    proc = _spawn(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    os.set_blocking(proc.stdout.fileno(), False)
+    output = ""
+    deadline = time.monotonic() + timeout
+    while marker not in output and time.monotonic() < deadline:
+        ready, _, _ = select.select([proc.stdout], [], [], 0.05)
+        if not ready:
+            continue
+        chunk = proc.stdout.read()
+        if not chunk:
+            break
+        output += chunk.decode(errors="replace")
+    proc.terminate()
+    # Only stdout is piped, so drain it directly instead of via communicate()
+    try:
+        proc.wait(timeout=1)
+    except subprocess.TimeoutExpired:
+        # dns-sd didn't go away; kill it and keep what was already read
+        proc.kill()
+        proc.wait()
+    rest = proc.stdout.read() or b""
+    proc.stdout.close()
+    _release(proc)
+    return output + rest.decode(errors="replace")
+
 def test_mdns_with_dns_sd():
-    """Test using dns-sd (macOS)"""
+    """Test using dns-sd (macOS)
+
+    Returns None when dns-sd is not installed.
+    """
     try:
-        # Test 1: Browse for HAP services
-        proc = subprocess.Popen(
-            ["dns-sd", "-B", "_hap._tcp", "local."],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        time.sleep(3)
-        proc.terminate()
-        output, _ = proc.communicate(timeout=1)
+        # Test 1: Browse for HAP services, stopping as soon as the bridge appears
+        output = _browse(["dns-sd", "-B", "_hap._tcp", "local."], "SmartThings Bridge")
 
         if "_hap._tcp" not in output:
             print(f"[FAIL] No HAP services found via mDNS", file=sys.stderr)
@@ -47,15 +176,7 @@ def test_mdns_with_dns_sd():
         print(f"[INFO] Found HAP services via mDNS", file=sys.stderr)
 
         # Test 2: Look up specific service (name changed to "SmartThings Bridge")
-        proc = subprocess.Popen(
-            ["dns-sd", "-L", "SmartThings Bridge", "_hap._tcp", "local."],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        time.sleep(3)
-        proc.terminate()
-        output, _ = proc.communicate(timeout=1)
+        output = _run_for(["dns-sd", "-L", "SmartThings Bridge", "_hap._tcp", "local."], 3)
 
         # Check for successful resolution
         if "can be reached at" in output:
@@ -65,43 +186,61 @@ def test_mdns_with_dns_sd():
                 return True
 
         # Alternative test: Query for the specific record
-        proc = subprocess.Popen(
-            ["dns-sd", "-q", "SmartThings HomeKit Bridge._hap._tcp.local", "SRV"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        time.sleep(2)
-        proc.terminate()
-        output, _ = proc.communicate(timeout=1)
+        output = _run_for(["dns-sd", "-q", "SmartThings HomeKit Bridge._hap._tcp.local", "SRV"], 2)
 
         if "51826" in output:
             print(f"[SUCCESS] Bridge SRV record found", file=sys.stderr)
             return True
 
-    except subprocess.TimeoutExpired:
-        # Check the partial output
-        if output and ("SmartThings" in output or "51826" in output):
-            print(f"[SUCCESS] Bridge partially resolved", file=sys.stderr)
-            return True
+    except FileNotFoundError:
+        return None
+    except _Cancelled:
+        pass
     except Exception as e:
         print(f"[ERROR] dns-sd test failed: {e}", file=sys.stderr)
 
     return False
 
+def test_mdns_with_cli_tools():
+    """Race avahi-browse and dns-sd, succeeding as soon as either finds the bridge"""
+    executor = ThreadPoolExecutor(max_workers=2)
+    pending = {executor.submit(test_mdns_with_avahi), executor.submit(test_mdns_with_dns_sd)}
+    answered = False
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result:
+                    return True
+                if result is not None:
+                    answered = True
+        if not answered:
+            print("[FAIL] Neither avahi-browse nor dns-sd is installed", file=sys.stderr)
+        return False
+    finally:
+        # Kill the losing tool so it doesn't hold up exit
+        _stop_children()
+        executor.shutdown(wait=True)
+
+def _open(host, port, timeout):
+    """Connect to host:port with the socket options every probe wants"""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    if hasattr(socket, "TCP_NODELAY"):
+        # Disable Nagle so small probe requests are flushed immediately
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
 def test_direct_port():
     """Test if HAP port is listening"""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(2)
-        result = sock.connect_ex(("localhost", 51826))
-        sock.close()
-        if result == 0:
-            print(f"[INFO] HAP port 51826 is listening", file=sys.stderr)
-            return True
-        else:
-            print(f"[FAIL] HAP port 51826 is not accessible", file=sys.stderr)
-            return False
+        with _open(_HOST, 51826, 2):
+            pass
+        print(f"[INFO] HAP port 51826 is listening", file=sys.stderr)
+        return True
+    except OSError:
+        print(f"[FAIL] HAP port 51826 is not accessible", file=sys.stderr)
+        return False
     except Exception as e:
         print(f"[ERROR] Port test failed: {e}", file=sys.stderr)
         return False
@@ -115,10 +254,10 @@ def main():
         sys.exit(1)
 
     # Test mDNS
-    if sys.platform == "darwin":
-        success = test_mdns_with_dns_sd()
+    if Zeroconf is not None:
+        success = test_mdns_with_zeroconf()
     else:
-        success = test_mdns_with_avahi()
+        success = test_mdns_with_cli_tools()
 
     if success:
         print("[SUCCESS] ✅ HAP server is properly advertised via mDNS", file=sys.stderr)